@@ -1,18 +1,27 @@
 import os
 import re
+import copy
+import json
+import asyncio
 import logging
+import threading
+from difflib import SequenceMatcher
 from datetime import datetime
+from functools import partial
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
 from docx import Document
+from docx.opc import phys_pkg
 from docx.shared import RGBColor, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn, nsdecls
 from docx.oxml import OxmlElement, parse_xml
 from docx.text.paragraph import Paragraph
 from docx.table import Table
-from docx.oxml.text.paragraph import CT_P
 from docx.oxml.table import CT_Tbl
-from openai import OpenAI
-from difflib import SequenceMatcher
+import docx.oxml.parser as oxml_parser
+from openai import OpenAI, AsyncOpenAI
 
 # Try to import streamlit for cloud deployment, fall back to dotenv for local
 try:
@@ -32,6 +41,12 @@ except ImportError:
 # Setup logging
 logging.basicConfig(filename=f"processor_{datetime.now().strftime('%Y%m%d')}.log", level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# python-docx parses every part with one module-level parser. Swap in one that lifts
+# libxml2's 10 MB text-node limit for large laws and skips xml:id bookkeeping.
+_docx_parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False, huge_tree=True, collect_ids=False)
+_docx_parser.set_element_class_lookup(oxml_parser.element_class_lookup)
+oxml_parser.oxml_parser = _docx_parser
+
 # Configuration
 DEFAULT_DIR = r"./docs/samples"
 os.makedirs(DEFAULT_DIR, exist_ok=True)
@@ -40,95 +55,197 @@ ARTICLE_RE = re.compile(r"^Član\s+(\d+[a-zA-Z]*)", re.IGNORECASE)
 GAZETTE_RE = re.compile(r'\"Sl\. glasnik RS\", br\. (.+?)\)')
 CHANGE_RE = re.compile(r"člana (\d+)\. stav (\d+)\. Zakona o računovodstvu")
 
-# Utility Functions
-def iter_block_items(doc):
-    for child in doc._body._element:
-        if isinstance(child, CT_P):
-            yield Paragraph(child, doc)
-        elif isinstance(child, CT_Tbl):
-            yield Table(child, doc)
-
-def get_font_color(run):
-    c = run.font.color
-    if c is not None and c.rgb is not None:
-        return f"#{c.rgb[0]:02X}{c.rgb[1]:02X}{c.rgb[2]:02X}"
-    return None
+# Stav repeals are applied locally; any other kind of change goes to GPT
+REPEAL_MARKER = "prestaju da važe"
+OTHER_CHANGE_RE = re.compile(r"\b(menja|menjaju|dodaje|dodaju|zamenjuje|zamenjuju|briše|brišu)\s+se\b", re.IGNORECASE)
+
+# Amended articles per GPT request, and how many requests may run at once
+AMENDMENT_CHUNK_SIZE = 10
+AMENDMENT_CONCURRENCY = 8
+
+# Word cap for the superblocks Part B diffs before descending into paragraphs
+MAX_WORDS = 500
+
+# Edit distance past which diff_opcodes hands the middle over to SequenceMatcher
+MYERS_MAX_EDITS = 300
+
+_W_NS = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+_W_P = qn('w:p')
+_W_T = qn('w:t')
+_SHD = qn('w:shd')
+_FILL = qn('w:fill')
+# Cloning a prebuilt w:shd is cheaper than OxmlElement plus three attribute sets
+_SHD_TEMPLATE = parse_xml(f'<w:shd {nsdecls("w")} w:val="clear" w:color="auto" w:fill="auto"/>')
+_W_R = qn('w:r')
+_W_PPR = qn('w:pPr')
+_W_RPR = qn('w:rPr')
+_W_COLOR = qn('w:color')
+_W_VAL = qn('w:val')
+_W_HYPERLINK = qn('w:hyperlink')
+_R_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+# Elements that point into other parts of the source package and would dangle in a copy
+_PART_REFS = {qn('w:commentRangeStart'), qn('w:commentRangeEnd'), qn('w:commentReference'), qn('w:footnoteReference'), qn('w:endnoteReference')}
+_EMBEDS = {qn('w:drawing'), qn('w:pict'), qn('w:object'), '{http://schemas.openxmlformats.org/markup-compatibility/2006}AlternateContent'}
+_BLOCKS_XPATH = etree.XPath('./w:p|./w:tbl', namespaces=_W_NS)
+# True when a paragraph holds anything clone_paragraph has to unwrap or drop
+_NEEDS_CLEANUP = etree.XPath(
+    'boolean(.//w:hyperlink | .//w:commentRangeStart | .//w:commentRangeEnd | .//w:commentReference'
+    ' | .//w:footnoteReference | .//w:endnoteReference | .//w:drawing | .//w:pict | .//w:object'
+    ' | .//mc:AlternateContent | .//@r:*)',
+    namespaces={**_W_NS, 'r': _R_NS[1:-1], 'mc': 'http://schemas.openxmlformats.org/markup-compatibility/2006'})
 
-def get_run_shading(run):
-    r_pr = run._element.rPr
-    if r_pr is not None:
-        shd = r_pr.find(qn("w:shd"))
-        if shd is not None:
-            fill = shd.get(qn("w:fill"))
-            return f"#{fill}" if fill else None
-    return None
-
-def get_paragraph_shading(paragraph):
-    pPr = paragraph._element.pPr
-    if pPr is not None:
-        shd = pPr.find(qn("w:shd"))
-        if shd is not None:
-            fill = shd.get(qn("w:fill"))
-            return f"#{fill}" if fill else None
-    return None
+# Utility Functions
+def block_elements(doc):
+    """Body-level w:p/w:tbl elements, indexed like extract_articles spans."""
+    return _BLOCKS_XPATH(doc.element.body)
+
+def paragraph_text(p_elem):
+    return ''.join(p_elem.itertext(_W_T))
+
+def scan_blocks(doc):
+    """Block elements of the body and their stripped texts, with 'TABLE' for tables."""
+    elems = block_elements(doc)
+    return elems, [paragraph_text(el).strip() if el.tag == _W_P else 'TABLE' for el in elems]
+
+def fingerprint_texts(*text_lists):
+    """Map each text to a small int shared across all lists, so diffs compare ints."""
+    table = {}
+    return [[table.setdefault(t, len(table)) for t in texts] for texts in text_lists]
+
+def diff_opcodes(a, b):
+    """SequenceMatcher-style opcodes from a Myers diff, falling back to SequenceMatcher past MYERS_MAX_EDITS."""
+    n, m = len(a), len(b)
+    # Amendments touch a few articles, so only the middle needs the full diff
+    pre = 0
+    while pre < n and pre < m and a[pre] == b[pre]:
+        pre += 1
+    suf = 0
+    while suf < n - pre and suf < m - pre and a[n - 1 - suf] == b[m - 1 - suf]:
+        suf += 1
+    equal_runs = [(n - suf, m - suf, suf)] if suf else []
+    a, b = a[pre:n - suf], b[pre:m - suf]
+    runs = _myers_equal_runs(a, b, pre)
+    if runs is None:
+        blocks = SequenceMatcher(None, a, b, autojunk=False).get_matching_blocks()
+        runs = [(i + pre, j + pre, size) for i, j, size in reversed(blocks) if size]
+    equal_runs.extend(runs)
+    if pre:
+        equal_runs.append((0, 0, pre))
+
+    opcodes = []
+    i = j = 0
+    for ei, ej, size in reversed(equal_runs):
+        if i < ei or j < ej:
+            tag = 'replace' if i < ei and j < ej else 'delete' if i < ei else 'insert'
+            opcodes.append((tag, i, ei, j, ej))
+        if opcodes and opcodes[-1][0] == 'equal':
+            opcodes[-1] = ('equal', opcodes[-1][1], ei + size, opcodes[-1][3], ej + size)
+        else:
+            opcodes.append(('equal', ei, ei + size, ej, ej + size))
+        i, j = ei + size, ej + size
+    if i < n or j < m:
+        tag = 'replace' if i < n and j < m else 'delete' if i < n else 'insert'
+        opcodes.append((tag, i, n, j, m))
+    return opcodes
+
+def _myers_equal_runs(a, b, offset=0, max_edits=MYERS_MAX_EDITS):
+    """Diagonal (equal) runs of the Myers path as (i, j, size), last run first, or None past max_edits."""
+    n, m = len(a), len(b)
+    v = {1: 0}
+    trace = []
+    for d in range(n + m + 1):
+        if d > max_edits:
+            return None
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+
+    # Walk the trace backwards, collecting diagonal (equal) runs
+    equal_runs = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        run = min(x - prev_x, y - prev_y) if d else x
+        if run > 0:
+            equal_runs.append((x - run + offset, y - run + offset, run))
+        x, y = prev_x, prev_y
+    return equal_runs
+
+def build_block_tree(texts, max_words=MAX_WORDS):
+    """Group block texts into superblocks as (start, end) spans, split at article titles and max_words."""
+    spans = []
+    start = words = 0
+    for i, text in enumerate(texts):
+        n = len(text.split())
+        if i > start and (ARTICLE_RE.match(text) or words + n > max_words):
+            spans.append((start, i))
+            start, words = i, 0
+        words += n
+    if start < len(texts):
+        spans.append((start, len(texts)))
+    return spans
+
+def block_tree_opcodes(a_ids, b_ids, a_texts, b_texts):
+    """diff_opcodes over superblocks first, re-diffing only replaced ones block by block."""
+    a_spans, b_spans = build_block_tree(a_texts), build_block_tree(b_texts)
+    a_keys, b_keys = fingerprint_texts([tuple(a_ids[s:e]) for s, e in a_spans],
+                                       [tuple(b_ids[s:e]) for s, e in b_spans])
+    # Superblock k covers blocks bounds[k]:bounds[k + 1]
+    a_bounds = [s for s, _ in a_spans] + [len(a_ids)]
+    b_bounds = [s for s, _ in b_spans] + [len(b_ids)]
+    opcodes = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(a_keys, b_keys):
+        a1, a2, b1, b2 = a_bounds[i1], a_bounds[i2], b_bounds[j1], b_bounds[j2]
+        if tag == 'replace':
+            opcodes.extend((t, x1 + a1, x2 + a1, y1 + b1, y2 + b1)
+                           for t, x1, x2, y1, y2 in diff_opcodes(a_ids[a1:a2], b_ids[b1:b2]))
+        else:
+            opcodes.append((tag, a1, a2, b1, b2))
+    return opcodes
 
 def get_cell_shading(cell):
     tc_pr = cell._tc.tcPr
     if tc_pr is not None:
-        shd = tc_pr.find(qn('w:shd'))
+        shd = tc_pr.find(_SHD)
         if shd is not None:
-            fill = shd.get(qn('w:fill'))
+            fill = shd.get(_FILL)
             return f"#{fill}" if fill else None
     return None
 
-def get_paragraph_indents(paragraph):
-    pf = paragraph.paragraph_format
-    d = {}
-    if pf.left_indent is not None: d['left'] = pf.left_indent.pt
-    if pf.right_indent is not None: d['right'] = pf.right_indent.pt
-    if pf.first_line_indent is not None:
-        if pf.first_line_indent.pt < 0:
-            d['hanging'] = abs(pf.first_line_indent.pt)
-        else:
-            d['first_line'] = pf.first_line_indent.pt
-    return d
-
-def get_paragraph_spacing(paragraph):
-    pf = paragraph.paragraph_format
-    d = {}
-    if pf.space_before is not None: d['space_before'] = pf.space_before.pt
-    if pf.space_after is not None: d['space_after'] = pf.space_after.pt
-    if pf.line_spacing is not None: d['line_spacing'] = pf.line_spacing
-    return d
-
 def set_run_shading(run, shading_hex):
     if not shading_hex:
         return
     rPr = run._r.get_or_add_rPr()
-    shd = OxmlElement('w:shd')
-    shd.set(qn('w:val'), 'clear')
-    shd.set(qn('w:color'), 'auto')
-    shd.set(qn('w:fill'), shading_hex.lstrip("#"))
+    shd = copy.deepcopy(_SHD_TEMPLATE)
+    shd.set(_FILL, shading_hex.lstrip("#"))
     rPr.append(shd)
 
-def set_paragraph_shading(paragraph, shading_hex):
-    if not shading_hex:
-        return
-    pPr = paragraph._element.get_or_add_pPr()
-    shd = OxmlElement('w:shd')
-    shd.set(qn('w:val'), 'clear')
-    shd.set(qn('w:color'), 'auto')
-    shd.set(qn('w:fill'), shading_hex.lstrip("#"))
-    pPr.append(shd)
-
 def set_cell_shading(cell, shading_hex):
     if not shading_hex:
         return
     tcPr = cell._tc.get_or_add_tcPr()
-    shd = OxmlElement('w:shd')
-    shd.set(qn('w:val'), 'clear')
-    shd.set(qn('w:color'), 'auto')
-    shd.set(qn('w:fill'), shading_hex.lstrip("#"))
+    shd = copy.deepcopy(_SHD_TEMPLATE)
+    shd.set(_FILL, shading_hex.lstrip("#"))
     tcPr.append(shd)
 
 def set_alignment(paragraph, align_str):
@@ -142,19 +259,6 @@ def set_alignment(paragraph, align_str):
     }
     paragraph.alignment = align_map.get(align_str.lower(), None)
 
-def set_indents(paragraph, indents):
-    if not indents:
-        return
-    pf = paragraph.paragraph_format
-    if 'left' in indents:
-        pf.left_indent = Pt(indents['left'])
-    if 'right' in indents:
-        pf.right_indent = Pt(indents['right'])
-    if 'first_line' in indents:
-        pf.first_line_indent = Pt(indents['first_line'])
-    if 'hanging' in indents:
-        pf.first_line_indent = Pt(-indents['hanging'])
-
 def set_spacing(paragraph, spacing):
     if not spacing:
         return
@@ -167,30 +271,47 @@ def set_spacing(paragraph, spacing):
         pf.line_spacing = spacing['line_spacing']
 
 def hex_to_rgb(hex_color):
-    hex_color = hex_color.lstrip('#')
-    lv = len(hex_color)
-    return tuple(int(hex_color[i:i + lv // 3], 16) for i in range(0, lv, lv // 3))
-
-def deep_copy_paragraph(source, target):
-    target.style = source.style
-    set_alignment(target, source.alignment.name.lower() if source.alignment else None)
-    set_indents(target, get_paragraph_indents(source))
-    set_spacing(target, get_paragraph_spacing(source))
-    if shading := get_paragraph_shading(source):
-        set_paragraph_shading(target, shading)
-    target.clear()
-    for run in source.runs:
-        new_run = target.add_run(run.text)
-        new_run.bold = run.bold
-        new_run.italic = run.italic
-        new_run.underline = run.underline
-        new_run.font.name = run.font.name
-        new_run.font.size = run.font.size
-        if color := get_font_color(run):
-            r, g, b = hex_to_rgb(color)
-            new_run.font.color.rgb = RGBColor(r, g, b)
-        if shading := get_run_shading(run):
-            set_run_shading(new_run, shading)
+    r, g, b = bytes.fromhex(hex_color.lstrip('#'))
+    return r, g, b
+
+def clone_paragraph(p_elem):
+    """Deep-copy a w:p for another document, unwrapping hyperlinks and dropping r:id references."""
+    new_p = copy.deepcopy(p_elem)
+    if not _NEEDS_CLEANUP(p_elem):
+        return new_p
+    for el in list(new_p.iter()):
+        parent = el.getparent()
+        if parent is None:
+            continue
+        if el.tag == _W_HYPERLINK:
+            idx = parent.index(el)
+            for child in list(el):
+                parent.insert(idx, child)
+                idx += 1
+            parent.remove(el)
+        elif el.tag in _PART_REFS or el.tag in _EMBEDS or any(k.startswith(_R_NS) for k in el.attrib):
+            parent.remove(el)
+    return new_p
+
+def restyled_paragraph(p_elem, text):
+    """New w:p with a deep copy of p_elem's paragraph properties and one plain run of text."""
+    new_p = OxmlElement('w:p')
+    if (ppr := p_elem.find(_W_PPR)) is not None:
+        new_p.append(copy.deepcopy(ppr))
+    new_p.add_r().text = text
+    return new_p
+
+def set_runs_color(p_elem, color):
+    """Set the font color of every run in a w:p element to `color` (an RGBColor)."""
+    val = str(color)
+    for r in p_elem.iter(_W_R):
+        rpr = r.find(_W_RPR)
+        c = rpr.find(_W_COLOR) if rpr is not None else None
+        if c is None:
+            c = r.get_or_add_rPr().get_or_add_color()
+        else:
+            c.attrib.clear()
+        c.set(_W_VAL, val)
 
 def set_table_borders(table):
     tbl = table._tbl
@@ -206,63 +327,125 @@ def set_table_borders(table):
     ).format(nsdecls('w'))
     tbl.tblPr.append(parse_xml(borders_xml))
     
-def deep_copy_table(source_table, target_doc, color=None):
-    target_table = target_doc.add_table(rows=len(source_table.rows), cols=len(source_table.columns))
+def new_paragraph(doc, text=''):
+    """Detached paragraph bound to doc's body; add it with append_blocks."""
+    paragraph = Paragraph(OxmlElement('w:p'), doc._body)
+    if text:
+        paragraph.add_run(text)
+    return paragraph
+
+def reference_paragraph(doc, ref, spacing=None):
+    """Detached centred w:p with `ref` in bold green Arial 12, deep-copied before changed articles."""
+    ref_p = new_paragraph(doc)
+    set_alignment(ref_p, 'center')
+    if spacing:
+        set_spacing(ref_p, spacing)
+    run = ref_p.add_run(ref)
+    run.bold = True
+    run.font.name = 'Arial'
+    run.font.size = Pt(12)
+    run.font.color.rgb = RGBColor(0, 204, 51)
+    return ref_p._element
+
+def append_blocks(doc, elements):
+    """Append block elements to the end of doc's body, moving w:sectPr back to the end once."""
+    body = doc._body._element
+    sect_pr = body.sectPr
+    body.extend(elements)
+    if sect_pr is not None:
+        body.append(sect_pr)
+
+def build_table_copy(source_table, target_doc, color=None):
+    """Copy a table for target_doc without inserting it; returns a detached Table for append_blocks."""
+    tbl = CT_Tbl.new_tbl(len(source_table.rows), len(source_table.columns), target_doc._block_width)
+    target_table = Table(tbl, target_doc._body)
+    target_table.style = None
     set_table_borders(target_table)
     for r, source_row in enumerate(source_table.rows):
         for c, source_cell in enumerate(source_row.cells):
             target_cell = target_table.cell(r, c)
             if shading := get_cell_shading(source_cell):
                 set_cell_shading(target_cell, '#8A084B')
-            for source_p in source_cell.paragraphs:
-                target_p = target_cell.add_paragraph()
-                deep_copy_paragraph(source_p, target_p)
+            for source_p in source_cell._tc.iterchildren(_W_P):
+                target_p = clone_paragraph(source_p)
                 if color:
-                    for run in target_p.runs:
-                        run.font.color.rgb = color
+                    set_runs_color(target_p, color)
+                target_cell._tc.append(target_p)
     return target_table
 
-def extract_articles(doc):
+def copy_block(el, source_doc, target_doc, color=None):
+    """Copy a body-level w:p/w:tbl of source_doc for target_doc, recoloured when `color` is given."""
+    if el.tag == _W_P:
+        new_el = clone_paragraph(el)
+        if color is not None:
+            set_runs_color(new_el, color)
+        return new_el
+    return build_table_copy(Table(el, source_doc._body), target_doc, color=color)._element
+
+def diff_block_copies(opcodes, orig, orig_elems, new_d, new_elems, target_doc):
+    """Yield the copied blocks of a colored diff in order: deleted red, inserted green."""
+    red, green = RGBColor(255, 0, 0), RGBColor(0, 204, 51)
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            yield from (copy_block(el, new_d, target_doc) for el in new_elems[j1:j2])
+            continue
+        # 'replace' is a delete followed by an insert; the empty side of the other two is a no-op slice
+        yield from (copy_block(el, orig, target_doc, red) for el in orig_elems[i1:i2])
+        yield from (copy_block(el, new_d, target_doc, green) for el in new_elems[j1:j2])
+
+def article_spans(texts):
+    """Article title -> (start, end) block span, from the stripped texts of scan_blocks."""
     articles = {}
-    blocks = list(iter_block_items(doc))
     current_article = None
     start = 0
-    for i, block in enumerate(blocks):
-        if isinstance(block, Paragraph) and ARTICLE_RE.match(block.text.strip()):
+    for i, text in enumerate(texts):
+        if ARTICLE_RE.match(text):
             if current_article:
                 articles[current_article] = (start, i)
-            current_article = block.text.strip()
+            current_article = text
             start = i
     if current_article:
-        articles[current_article] = (start, len(blocks))
+        articles[current_article] = (start, len(texts))
     return articles
 
+def extract_articles(doc):
+    return article_spans(scan_blocks(doc)[1])
+
+def find_gazette_paragraph(doc):
+    """First body paragraph citing the gazette, or None."""
+    for el in block_elements(doc):
+        if el.tag == _W_P and "Sl. glasnik RS" in paragraph_text(el):
+            return Paragraph(el, doc._body)
+    return None
+
 def merge_gazette(old_doc, gov_doc, target_doc):
-    for block in iter_block_items(old_doc):
-        if isinstance(block, Paragraph) and "Sl. glasnik RS" in block.text:
-            gov_line = next((q.text for q in iter_block_items(gov_doc) if isinstance(q, Paragraph) and "Sl. glasnik RS" in q.text), "")
-            merged = merge_gazette_text(block.text, gov_line)
-            for t_block in iter_block_items(target_doc):
-                if isinstance(t_block, Paragraph) and "Sl. glasnik RS" in t_block.text:
-                    deep_copy_paragraph(block, t_block)
-                    t_block.text = merged
-                    return True
-    return False
+    block = find_gazette_paragraph(old_doc)
+    t_block = find_gazette_paragraph(target_doc)
+    if block is None or t_block is None:
+        return False
+    gov_block = find_gazette_paragraph(gov_doc)
+    merged = merge_gazette_text(paragraph_text(block._element),
+                                paragraph_text(gov_block._element) if gov_block is not None else "")
+    t_elem = t_block._element
+    t_elem.getparent().replace(t_elem, restyled_paragraph(block._element, merged))
+    return True
+
+def _ref_key(ref):
+    # Bare numbers first, then "73/2019"-style refs in string order
+    return (not ref.isdigit(), ref)
 
 def merge_gazette_text(old_text, new_text):
     m_old = GAZETTE_RE.search(old_text)
     m_new = GAZETTE_RE.search(new_text)
     if m_old and m_new:
-        old_refs = set(ref.strip() for ref in m_old.group(1).split(' i '))
-        new_refs = set(ref.strip() for ref in m_new.group(1).split(' i '))
-        merged_refs = sorted(old_refs.union(new_refs), key=lambda x: (not x.isdigit(), x))
+        refs = [ref.strip() for ref in m_old.group(1).split(' i ')] + [ref.strip() for ref in m_new.group(1).split(' i ')]
+        merged_refs = sorted(dict.fromkeys(refs), key=_ref_key)
         return old_text.replace(m_old.group(0), f'(\"Sl. glasnik RS\", br. {" i ".join(merged_refs)})')
     return old_text
 
-def apply_amendment_text(old_text, instruction):
-    prompt = f"""
-    You are an expert in Serbian legislative amendments. Apply the changes to the old article text exactly as per the instruction. If it says a stav 'prestaju da važe' (ceases to be valid), delete that stav from the text, append '*' to the article title. The 'stav' number refers to the (number)th paragraph after the title. Return only the updated text, using new lines for paragraphs/stavs, preserving structure.
+AMENDMENT_RULES = "You are an expert in Serbian legislative amendments. Apply the changes to the old article text exactly as per the instruction. If it says a stav 'prestaju da važe' (ceases to be valid), delete that stav from the text, append '*' to the article title. The 'stav' number refers to the (number)th paragraph after the title."
 
+AMENDMENT_EXAMPLES = """
     Example 1 (exact sample):
     Old text: 'Član 9 \n<p>Knjiženje poslovnih promena i događaja (u daljem tekstu: poslovnih promena) na računima imovine, obaveza, kapitala, prihoda i rashoda vrši se na osnovu verodostojnih računovodstvenih isprava. \nRačunovodstvena isprava predstavlja pisani dokument ili elektronski zapis o nastaloj poslovnoj promeni, koja obuhvata sve podatke potrebne za knjiženje u poslovnim knjigama tako da se iz računovodstvene isprave nedvosmisleno može saznati osnov, vrsta i sadržaj poslovne promene. \nFaktura (račun) kao računovodstvena isprava, u smislu ovog zakona, sastavlja se i dostavlja pravnim licima i preduzetnicima u elektronskom obliku i mora biti potvrđena od strane odgovornog lica koje svojim potpisom ili drugom identifikacionom oznakom (utvrđenom opštim aktom kojim pravno lice, odnosno preduzetnik uređuje organizaciju računovodstva) potvrđuje njenu verodostojnost. \nRačunovodstvena isprava sastavlja se u potrebnom broju primeraka na mestu i u vreme nastanka poslovne promene. \nRačunovodstvena isprava koja je sastavljena u jednom primerku može se otpremiti ako su podaci iz te isprave stalno dostupni. \nFotokopija računovodstvene isprave je osnov za knjiženje poslovne promene, pod uslovom da je na njoj navedeno mesto čuvanja originalne isprave i da je potvrđena od strane odgovornog lica koji svojim potpisom ili drugom identifikacionom oznakom potvrđuje njenu verodostojnost. \nRačunovodstvenom ispravom smatra se i isprava ispostavljena, odnosno primljena telekomunikacionim putem, kao i isprava ispostavljena, odnosno primljena putem servisa za elektronsku razmenu podataka (Electronic data Interchange - EDI). \nPošiljalac je odgovoran da podaci na ulazu u telekomunikacioni sistem budu zasnovani na računovodstvenim ispravama, kao i da čuva originalne računovodstvene isprave. \nKada se računovodstvena isprava prenosi putem servisa za elektronsku razmenu podataka, pružalac usluge elektronske razmene podataka dužan je da obezbedi integritet razmenjenih podataka.'
     Instruction: 'člana 9. stav 3. Zakona o računovodstvu prestaje da važe'
@@ -272,42 +455,239 @@ def apply_amendment_text(old_text, instruction):
     Old text: 'Član 64 \nOdredbe člana 4. stav 7, člana 32. stav 4. tačka 2), člana 39. stav 3. tačka 2) i člana 40. stav 5. tačka 4) ovog zakona primenjuju se od dana prijema Republike Srbije u Evropsku uniju. \nOdredbe člana 6. st. 13. i 14, člana 29, čl. 44-49, čl. 51. i 52. ovog zakona, počeće da se primenjuju od finansijskih izveštaja koji se sastavljaju na dan 31. decembra 2021. godine. \nOdredba člana 9. stav 3. ovog zakona primenjuje se počev od 1. januara 2022. godine.'
     Instruction: 'člana 64. stav 3. Zakona o računovodstvu prestaje da važe'
     Updated: 'Član 64*\nOdredbe člana 4. stav 7, člana 32. stav 4. tačka 2), člana 39. stav 3. tačka 2) i člana 40. stav 5. tačka 4) ovog zakona primenjuju se od dana prijema Republike Srbije u Evropsku uniju. \nOdredbe člana 6. st. 13. i 14, člana 29, čl. 44-49, čl. 51. i 52. ovog zakona, počeće da se primenjuju od finansijskih izveštaja koji se sastavljaju na dan 31. decembra 2021. godine.'
+"""
+
+SYSTEM_PROMPT = "You are a precise legal document editor for Serbian laws."
+
+def valid_amendment_lines(lines):
+    return bool(lines) and len(lines) > 1 and '*' in lines[0]
+
+def local_apply_amendment(old_text, instruction):
+    """Apply a plain stav repeal without GPT, or return None if it needs the model."""
+    if REPEAL_MARKER not in instruction or OTHER_CHANGE_RE.search(instruction):
+        return None
+    lines = [line.strip() for line in old_text.splitlines() if line.strip()]
+    title = ARTICLE_RE.match(lines[0]) if lines else None
+    if title is None:
+        return None
+    stavs = {int(stav_num) for article_num, stav_num in CHANGE_RE.findall(instruction) if article_num == title.group(1)}
+    if not stavs or not all(1 <= n < len(lines) for n in stavs):
+        return None
+    updated = [line for i, line in enumerate(lines) if i not in stavs]
+    if not updated[0].endswith('*'):
+        updated[0] += '*'
+    return updated
+
+def resolve_amendments_locally(items):
+    """Split items into rule-engine results and the items that still need GPT."""
+    results, remaining = {}, []
+    for item in items:
+        lines = local_apply_amendment(item["old_text"], item["instruction"])
+        if lines is None:
+            logging.info(f"No local rule for {item['id']}, using GPT: {item['instruction']}")
+            remaining.append(item)
+        else:
+            results[item["id"]] = lines
+    return results, remaining
 
+def amendment_request_body(old_text, instruction):
+    prompt = f"""
+    {AMENDMENT_RULES} Return only the updated text, using new lines for paragraphs/stavs, preserving structure.
+    {AMENDMENT_EXAMPLES}
     Now apply:
     Old text:\n{old_text}\n\nInstruction:\n{instruction}
     """
-    for attempt in range(3):
+    return {
+        "model": "gpt-4.1-nano",
+        "messages": [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+        "temperature": 0.1,
+        "max_tokens": 2000
+    }
+
+def parse_amendment_lines(content):
+    return [line.strip() for line in content.strip().splitlines() if line.strip()]
+
+def collect_amendment_items(amend_doc, articles, block_elems):
+    """One {id, old_text, instruction} dict per article of `articles` that amend_doc repeals stavs of."""
+    items = {}
+    # One text read per paragraph, straight off the XML
+    for p_elem in amend_doc.element.body.iterchildren(_W_P):
+        inst = paragraph_text(p_elem).strip()
+        if REPEAL_MARKER not in inst:
+            continue
+        for article_num, stav_num in CHANGE_RE.findall(inst):
+            aid = f"Član {article_num}"
+            if aid not in articles:
+                continue
+            item = items.get(aid)
+            if item is None:
+                s, e = articles[aid]
+                old_text = '\n'.join(paragraph_text(el) for el in block_elems[s:e] if el.tag == _W_P)
+                items[aid] = {"id": aid, "old_text": old_text, "instruction": inst}
+            elif inst not in item["instruction"]:
+                item["instruction"] += "\n" + inst
+    return list(items.values())
+
+def _chunk_prompt(items):
+    payload = json.dumps([{"id": item["id"], "old_text": item["old_text"], "instruction": item["instruction"]} for item in items], ensure_ascii=False, indent=1)
+    return f"""
+    {AMENDMENT_RULES} Each amendment below is independent.
+    {AMENDMENT_EXAMPLES}
+    Reply with a JSON object of the form {{"results": [{{"id": "<amendment id>", "lines": ["<title>*", "<stav>", ...]}}, ...]}} with one entry per amendment, each line being one paragraph/stav of the updated text.
+
+    Now apply:
+    {payload}
+    """
+
+def _chunk_entry_lines(entry):
+    """Stripped lines of one JSON result entry, or None if the entry is malformed."""
+    if not isinstance(entry, dict) or not isinstance(entry.get("lines"), list):
+        return None
+    if not all(isinstance(line, str) for line in entry["lines"]):
+        return None
+    lines = [line.strip() for line in entry["lines"] if line.strip()]
+    return lines if valid_amendment_lines(lines) else None
+
+async def _apply_amendments_chunk(aclient, sem, chunk):
+    """JSON-mode chat completions for a chunk of amendments; 3 attempts, each retrying only the ids still missing."""
+    results = {}
+    pending = {item["id"]: item for item in chunk}
+    async with sem:
+        for attempt in range(3):
+            try:
+                response = await aclient.chat.completions.create(
+                    model="gpt-4.1-nano",
+                    messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": _chunk_prompt(pending.values())}],
+                    response_format={"type": "json_object"},
+                    temperature=0.1,
+                    max_tokens=min(2000 * len(pending), 32000)
+                )
+                data = json.loads(response.choices[0].message.content)
+                for entry in data.get("results", []):
+                    lines = _chunk_entry_lines(entry)
+                    if lines is not None and entry.get("id") in pending:
+                        results[entry["id"]] = lines
+                        del pending[entry["id"]]
+                if not pending:
+                    logging.info(f"GPT batch success: {len(results)}/{len(chunk)} amendments.")
+                    return results
+                raise ValueError(f"No valid output for {', '.join(pending)}")
+            except Exception as e:
+                logging.warning(f"GPT batch attempt {attempt+1}: {e}")
+    logging.error(f"GPT batch failed for {', '.join(pending)}.")
+    return results
+
+async def _apply_amendment_chunks(chunks, max_concurrency):
+    # A fresh async client per run: its connection pool is bound to the event loop
+    async with AsyncOpenAI(api_key=client.api_key) as aclient:
+        sem = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(*(_apply_amendments_chunk(aclient, sem, chunk) for chunk in chunks))
+
+def apply_amendments_batch(items, chunk_size=AMENDMENT_CHUNK_SIZE, max_concurrency=AMENDMENT_CONCURRENCY):
+    """Apply amendments in concurrent chunked GPT requests; returns id -> lines for the applied ids."""
+    results, items = resolve_amendments_locally(items)
+    if not items:
+        return results
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    for chunk_results in asyncio.run(_apply_amendment_chunks(chunks, max_concurrency)):
+        results.update(chunk_results)
+    return results
+
+def apply_amendments_batch_api(items, poll_interval=30, cancel=None):
+    """Apply amendments through the OpenAI Batch API, stopping if `cancel` is set; same contract as apply_amendments_batch."""
+    cancel = cancel or threading.Event()
+    results, items = resolve_amendments_locally(items)
+    if not items:
+        return results
+    ids = {item["id"] for item in items}
+    jsonl = "\n".join(
+        json.dumps({"custom_id": item["id"], "method": "POST", "url": "/v1/chat/completions", "body": amendment_request_body(item["old_text"], item["instruction"])}, ensure_ascii=False)
+        for item in items
+    )
+    try:
+        batch_file = client.files.create(file=("amendments.jsonl", jsonl.encode("utf-8")), purpose="batch")
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        logging.info(f"Submitted batch {batch.id} with {len(items)} amendments.")
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if cancel.wait(poll_interval):
+                client.batches.cancel(batch.id)
+                logging.info(f"Cancelled batch {batch.id}.")
+                return results
+            batch = client.batches.retrieve(batch.id)
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"batch {batch.id} ended with status {batch.status}")
+        output = client.files.content(batch.output_file_id).text
+    except Exception as e:
+        logging.error(f"Batch API failed: {e}. Falling back.")
+        return results
+    for line in output.splitlines():
+        if not line.strip():
+            continue
         try:
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[{"role": "system", "content": "You are a precise legal document editor for Serbian laws."}, {"role": "user", "content": prompt}],
-                temperature=0.1,
-                max_tokens=2000
-            )
-            content = response.choices[0].message.content.strip()
-            lines = [line.strip() for line in content.splitlines() if line.strip()]
-            if lines and len(lines) > 1 and '*' in lines[0]:
-                logging.info("GPT success.")
-                return lines
-            raise ValueError("Invalid output")
+            entry = json.loads(line)
+            aid = entry.get("custom_id")
+            response = entry.get("response") or {}
+            if aid not in ids or response.get("status_code") != 200:
+                logging.warning(f"Batch request {aid} failed: {entry.get('error')}")
+                continue
+            lines = parse_amendment_lines(response["body"]["choices"][0]["message"]["content"])
         except Exception as e:
-            logging.warning(f"GPT attempt {attempt+1}: {e}")
-    logging.error("GPT failed. Falling back.")
-    return old_text.splitlines()
+            logging.warning(f"Skipping malformed batch output line: {e}")
+            continue
+        if valid_amendment_lines(lines):
+            results[aid] = lines
+        else:
+            logging.warning(f"Batch request {aid}: invalid output")
+    return results
+
+def replace_article_paragraphs(doc, block_elems, span, new_lines):
+    """Swap the paragraphs of an article span for new_lines, in place, keeping formatting where lines survive."""
+    s, e = span
+    old_paras = [el for el in block_elems[s:e] if el.tag == _W_P]
+    if not old_paras:
+        return
+    by_text = {}
+    for el in old_paras:
+        by_text.setdefault(paragraph_text(el).strip(), el)
+    prev = old_paras[0]
+    for i, line in enumerate(new_lines):
+        source = by_text.get(line.strip())
+        if source is not None:
+            new_p = Paragraph(copy.deepcopy(source), doc._body)
+        elif i < len(old_paras):
+            new_p = Paragraph(restyled_paragraph(old_paras[i], line), doc._body)
+        else:
+            new_p = new_paragraph(doc, line)
+        # Ensure article titles have center, Arial 12 bold
+        if ARTICLE_RE.match(line):
+            set_alignment(new_p, 'center')
+            for run in new_p.runs:
+                run.bold = True
+                run.font.name = 'Arial'
+                run.font.size = Pt(12)
+        prev.addnext(new_p._element)
+        prev = new_p._element
+    for el in old_paras:
+        el.getparent().remove(el)
 
 def extract_amending_ref(gov_doc):
     article = ""
     law_name = ""
     gazette = ""
-    for block in iter_block_items(gov_doc):
-        if isinstance(block, Paragraph):
-            text = block.text.strip()
-            if ARTICLE_RE.match(text):
-                article = text.upper()
-            if "ZAKON O" in text.upper():
-                law_name = text.upper()
-            if "SL. GLASNIK RS" in text.upper():
-                gazette = text.upper()
+    # The last match of each field wins, so scan backwards and stop once all are found
+    elems, texts = scan_blocks(gov_doc)
+    for el, text in zip(reversed(elems), reversed(texts)):
+        if el.tag != _W_P:
+            continue
+        upper = text.upper()
+        if not article and ARTICLE_RE.match(text):
+            article = upper
+        if not law_name and "ZAKON O" in upper:
+            law_name = upper
+        if not gazette and "SL. GLASNIK RS" in upper:
+            gazette = upper
+        if article and law_name and gazette:
+            break
     if article and law_name and gazette:
         return f"[{article} {law_name} {gazette}]"
     return '[ČLAN 23 STAV 2 ZAKONA O ELEKTRONSKOM FAKTURISANJU ("SL. GLASNIK RS", BR. 44/2021)]'
@@ -353,6 +733,90 @@ def add_explanatory_table(doc):
     run.font.size = Pt(13)
     run.font.color.rgb = RGBColor(255, 232, 191)
 
+# Part A and Part B, shared by the Streamlit and Tk front ends
+def _build_new_doc(orig, amend_doc, apply=apply_amendments_batch):
+    """Part A: New.docx built from orig with amend_doc's amendments, and the ids `apply` left unapplied"""
+    updated_doc = Document()
+    
+    # Copy original document structure: paragraphs are cloned as XML, tables rebuilt
+    append_blocks(updated_doc, (copy_block(el, orig, updated_doc) for el in block_elements(orig)))
+    
+    # Merge gazette information
+    merge_gazette(orig, amend_doc, updated_doc)
+    
+    # One body scan gives both the article spans and the elements they index
+    block_elems, block_texts = scan_blocks(updated_doc)
+    articles = article_spans(block_texts)
+    items = collect_amendment_items(amend_doc, articles, block_elems)
+
+    results = apply(items)
+
+    # Swap amended articles in place; spans refer to the element snapshot
+    for aid, new_lines in results.items():
+        replace_article_paragraphs(updated_doc, block_elems, articles[aid], new_lines)
+    unapplied = [item["id"] for item in items if item["id"] not in results]
+    
+    return updated_doc, unapplied
+
+def _build_diff_doc(orig, new_d, ref, ref_spacing=None):
+    """Part B: Colored Diff.docx of orig against new_d, with `ref` before every changed article"""
+    diff_doc = Document()
+    
+    # Add explanatory table
+    add_explanatory_table(diff_doc)
+    
+    # Prepare texts for diff: one pass per document, straight from the XML
+    orig_elems, orig_texts = scan_blocks(orig)
+    # The same document in both slots is scanned once; the diff then trims down to one equal run
+    new_elems, new_texts = (orig_elems, orig_texts) if new_d is orig else scan_blocks(new_d)
+    new_texts = [text.replace('*', '') for text in new_texts]
+    
+    # Myers diff on int fingerprints, per article superblock first; opcode indices address the element lists
+    orig_ids, new_ids = fingerprint_texts(orig_texts, new_texts)
+    
+    # Copies stream straight into the body; no list of cloned blocks is kept
+    opcodes = block_tree_opcodes(orig_ids, new_ids, orig_texts, new_texts)
+    append_blocks(diff_doc, diff_block_copies(opcodes, orig, orig_elems, new_d, new_elems, diff_doc))
+
+    # Insert dynamic green reference, anchored on one snapshot of the body
+    diff_elems, diff_texts = scan_blocks(diff_doc)
+    ref_p = reference_paragraph(diff_doc, ref, ref_spacing)
+    
+    for el, text in zip(diff_elems, diff_texts):
+        if '*' in text and ARTICLE_RE.match(text):
+            el.addprevious(copy.deepcopy(ref_p))
+    
+    return diff_doc
+
+# Streamlit pipelines: plain bytes in and out, so they run in any worker process
+def build_new_docx(orig_bytes, amend_bytes, fast=False):
+    """Process Part A: Generate New.docx from the raw .docx uploads, returned as .docx bytes and the ids left unapplied"""
+    updated_doc, unapplied = _build_new_doc(Document(BytesIO(orig_bytes)), Document(BytesIO(amend_bytes)))
+    return doc_to_bytes(updated_doc, compresslevel=1 if fast else None), unapplied
+
+def build_diff_docx(orig_bytes, new_bytes, ref, fast=False):
+    """Process Part B: Generate Colored Diff.docx from the raw .docx uploads, returned as .docx bytes"""
+    orig = Document(BytesIO(orig_bytes))
+    # The same file in both slots is parsed once
+    new_d = orig if new_bytes == orig_bytes else Document(BytesIO(new_bytes))
+    return doc_to_bytes(_build_diff_doc(orig, new_d, ref), compresslevel=1 if fast else None)
+
+def doc_to_bytes(doc, compresslevel=None):
+    """Convert Document to bytes for download; a low compresslevel zips faster but larger"""
+    bio = BytesIO()
+    if compresslevel is None:
+        doc.save(bio)
+    else:
+        # python-docx opens its ZipFile without a level; workers run one job at a time, so a swap is safe
+        zip_file = phys_pkg.ZipFile
+        phys_pkg.ZipFile = partial(zip_file, compresslevel=compresslevel)
+        try:
+            doc.save(bio)
+        finally:
+            phys_pkg.ZipFile = zip_file
+    bio.seek(0)
+    return bio.getvalue()
+
 # GUI App class - only available when tkinter can be imported
 try:
     import tkinter as tk
@@ -365,6 +829,13 @@ try:
             self.geometry("700x500")
             self.orig_path = self.amend_path = self.new_path = ""
             self.updated_doc = self.diff_doc = None
+            # Parsed inputs keyed by (path, mtime); they are only ever read, so Part A and B can share them
+            self._doc_cache = {}
+            # Part A/B run here so the Tk loop stays responsive; widgets are only touched via self.after
+            self._executor = ThreadPoolExecutor(max_workers=2)
+            # Set on close; a Batch API poll watches it so its worker lets the process exit
+            self._closing = threading.Event()
+            self.protocol("WM_DELETE_WINDOW", self._on_close)
 
             frame = tk.Frame(self)
             frame.pack(pady=10, fill="x")
@@ -384,6 +855,9 @@ try:
             self.entry_new.grid(row=2, column=1)
             tk.Button(frame, text="Browse", command=self.select_new).grid(row=2, column=2)
 
+            self.use_batch_api = tk.BooleanVar(value=False)
+            tk.Checkbutton(self, text="Use OpenAI Batch API for Part A (50% cheaper, may take up to 24h)", variable=self.use_batch_api).pack(anchor="w", padx=50)
+
             tk.Button(self, text="Process Part A: Generate New.docx", bg="#007ACC", fg="white", command=self.process_part_a).pack(pady=5, fill="x", padx=50)
             tk.Button(self, text="Process Part B: Generate Colored Diff.docx", bg="#28a745", fg="white", command=self.process_part_b).pack(pady=5, fill="x", padx=50)
             tk.Button(self, text="Save New.docx", command=lambda: self.save(self.updated_doc, "new")).pack(pady=5, fill="x", padx=50)
@@ -399,9 +873,40 @@ try:
             self.log_text.see(tk.END)
             self.log_text.config(state='disabled')
 
+        def _log_async(self, msg):
+            self.after(0, lambda: self.update_log(msg))
+
+        def _submit(self, label, work):
+            def run():
+                try:
+                    work()
+                except Exception as e:
+                    logging.exception("%s failed", label)
+                    err = f"{label} failed: {e}"
+                    self.after(0, lambda: (self.update_log(err), messagebox.showerror("Error", err)))
+            self._executor.submit(run)
+
+        def _on_close(self):
+            self._closing.set()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self.destroy()
+
+        def _load(self, path):
+            key = (path, os.path.getmtime(path))
+            doc = self._doc_cache.get(key)
+            if doc is None:
+                doc = Document(path)
+                self._doc_cache[key] = doc
+            return doc
+
+        def _forget(self, path):
+            for key in [k for k in self._doc_cache if k[0] == path]:
+                del self._doc_cache[key]
+
         def select_original(self):
             path = filedialog.askopenfilename(initialdir=DEFAULT_DIR, filetypes=[("Word Documents", "*.docx")])
             if path:
+                self._forget(self.orig_path)
                 self.orig_path = path
                 self.entry_orig.delete(0, tk.END)
                 self.entry_orig.insert(0, path)
@@ -409,6 +914,7 @@ try:
         def select_amendment(self):
             path = filedialog.askopenfilename(initialdir=DEFAULT_DIR, filetypes=[("Word Documents", "*.docx")])
             if path:
+                self._forget(self.amend_path)
                 self.amend_path = path
                 self.entry_amend.delete(0, tk.END)
                 self.entry_amend.insert(0, path)
@@ -416,6 +922,7 @@ try:
         def select_new(self):
             path = filedialog.askopenfilename(initialdir=DEFAULT_DIR, filetypes=[("Word Documents", "*.docx")])
             if path:
+                self._forget(self.new_path)
                 self.new_path = path
                 self.entry_new.delete(0, tk.END)
                 self.entry_new.insert(0, path)
@@ -426,51 +933,27 @@ try:
                 return
             self.update_log("Processing Part A...")
             logging.info("Starting Part A")
+            orig_path, amend_path = self.orig_path, self.amend_path
+            use_batch_api = self.use_batch_api.get()
 
-            orig = Document(self.orig_path)
-            self.updated_doc = Document()
-            for block in iter_block_items(orig):
-                if isinstance(block, Paragraph):
-                    p = self.updated_doc.add_paragraph()
-                    deep_copy_paragraph(block, p)
-                elif isinstance(block, Table):
-                    deep_copy_table(block, self.updated_doc)
-
-            merge_gazette(orig, Document(self.amend_path), self.updated_doc)
-
-            articles = extract_articles(self.updated_doc)
-            amend_doc = Document(self.amend_path)
-            amendments = [p.text.strip() for p in amend_doc.paragraphs if "prestaju da važe" in p.text]
-
-            for inst in amendments:
-                matches = CHANGE_RE.findall(inst)
-                for article_num, stav_num in matches:
-                    aid = f"Član {article_num}"
-                    if aid in articles:
-                        s, e = articles[aid]
-                        old_lines = '\n'.join(self.updated_doc.paragraphs[k].text for k in range(s, e))
-                        new_lines = apply_amendment_text(old_lines, inst)
-                        
-                        # Remove old paras
-                        for k in range(e - 1, s - 1, -1):
-                            self.updated_doc.paragraphs[k]._element.getparent().remove(self.updated_doc.paragraphs[k]._element)
-                        
-                        # Insert new
-                        for i, line in enumerate(new_lines):
-                            new_p = self.updated_doc.add_paragraph(line)
-                            original_format_idx = s + i
-                            if original_format_idx < len(orig.paragraphs):
-                                deep_copy_paragraph(orig.paragraphs[original_format_idx], new_p)
-                            # Ensure article titles have center, Arial 12 bold
-                            if ARTICLE_RE.match(line):
-                                set_alignment(new_p, 'center')
-                                for run in new_p.runs:
-                                    run.bold = True
-                                    run.font.name = 'Arial'
-                                    run.font.size = Pt(12)
-
-            self.update_log("Part A complete.")
-            messagebox.showinfo("Success", "New.docx generated.")
+            def _work():
+                def apply(items):
+                    if not use_batch_api:
+                        return apply_amendments_batch(items)
+                    self._log_async(f"Submitting {len(items)} amendments to the Batch API...")
+                    return apply_amendments_batch_api(items, cancel=self._closing)
+
+                updated_doc, unapplied = _build_new_doc(self._load(orig_path), self._load(amend_path), apply)
+                if self._closing.is_set():
+                    return
+                if unapplied:
+                    self._log_async(f"Not applied, original text kept: {', '.join(unapplied)}")
+
+                # Publish only the finished document; Save never sees one that is still being built
+                self.updated_doc = updated_doc
+                self.after(0, lambda: (self.update_log("Part A complete."), messagebox.showinfo("Success", "New.docx generated.")))
+
+            self._submit("Part A", _work)
 
         def process_part_b(self):
             if not self.orig_path or not self.new_path or not self.amend_path:
@@ -479,121 +962,27 @@ try:
             self.update_log("Processing Part B...")
             logging.info("Starting Part B")
 
-            orig = Document(self.orig_path)
-            new_d = Document(self.new_path)
-            gov = Document(self.amend_path)
-            self.diff_doc = Document()
-
-            add_explanatory_table(self.diff_doc)
-
-            # # Add adjusted title table once
-            # for block in iter_block_items(new_d):
-            #     if isinstance(block, Table):
-            #         target_table = deep_copy_table(block, self.diff_doc)
-            #         for row in target_table.rows:
-            #             for cell in row.cells:
-            #                 set_cell_shading(cell, '#8A084B')
-            #         break
-
-            # Prepare texts for diff, normalizing article titles by removing '*'
-            orig_blocks = list(iter_block_items(orig))
-            new_blocks = list(iter_block_items(new_d))
-            orig_texts = []
-            for b in orig_blocks:
-                if isinstance(b, Paragraph):
-                    text = b.text.strip()
-                    orig_texts.append(text)
-                elif isinstance(b, Table):
-                    orig_texts.append('TABLE')
-            new_texts = []
-            for b in new_blocks:
-                if isinstance(b, Paragraph):
-                    text = b.text.strip()
-                    text = text.replace('*', '')
-                    new_texts.append(text)
-                elif isinstance(b, Table):
-                    new_texts.append('TABLE')
-
-            matcher = SequenceMatcher(None, orig_texts, new_texts)
-
-            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-                if tag == 'equal':
-                    for k in range(i1, i2):
-                        block = new_blocks[j1 + (k - i1)]
-                        if isinstance(block, Paragraph):
-                            p = self.diff_doc.add_paragraph()
-                            deep_copy_paragraph(block, p)
-                        elif isinstance(block, Table):
-                            deep_copy_table(block, self.diff_doc)
-                elif tag == 'delete':
-                    for k in range(i1, i2):
-                        block = orig_blocks[k]
-                        if isinstance(block, Paragraph):
-                            p = self.diff_doc.add_paragraph('[' + block.text + ']')
-                            deep_copy_paragraph(block, p)
-                            for run in p.runs:
-                                run.font.color.rgb = RGBColor(255, 0, 0)
-                        elif isinstance(block, Table):
-                            deep_copy_table(block, self.diff_doc, color=RGBColor(255, 0, 0))
-                elif tag == 'insert':
-                    for k in range(j1, j2):
-                        block = new_blocks[k]
-                        if isinstance(block, Paragraph):
-                            p = self.diff_doc.add_paragraph('[' + block.text + ']')
-                            deep_copy_paragraph(block, p)
-                            for run in p.runs:
-                                run.font.color.rgb = RGBColor(0, 204, 51)
-                        elif isinstance(block, Table):
-                            deep_copy_table(block, self.diff_doc, color=RGBColor(0, 204, 51))
-                elif tag == 'replace':
-                    for k in range(i1, i2):
-                        block = orig_blocks[k]
-                        if isinstance(block, Paragraph):
-                            p = self.diff_doc.add_paragraph('[' + block.text + ']')
-                            deep_copy_paragraph(block, p)
-                            for run in p.runs:
-                                run.font.color.rgb = RGBColor(255, 0, 0)
-                        elif isinstance(block, Table):
-                            deep_copy_table(block, self.diff_doc, color=RGBColor(255, 0, 0))
-                    for k in range(j1, j2):
-                        block = new_blocks[k]
-                        if isinstance(block, Paragraph):
-                            p = self.diff_doc.add_paragraph('[' + block.text + ']')
-                            deep_copy_paragraph(block, p)
-                            for run in p.runs:
-                                run.font.color.rgb = RGBColor(0, 204, 51)
-                        elif isinstance(block, Table):
-                            deep_copy_table(block, self.diff_doc, color=RGBColor(0, 204, 51))
-
-            # Insert dynamic green reference before changed articles (collect positions first to avoid index shifts)
-            diff_blocks = list(iter_block_items(self.diff_doc))
-            insert_positions = []
-            ref = extract_amending_ref(gov)
-            for idx, block in enumerate(diff_blocks):
-                if isinstance(block, Paragraph) and ARTICLE_RE.match(block.text.strip()) and '*' in block.text:
-                    insert_positions.append(idx)
-            for pos in reversed(insert_positions):
-                ref_p = self.diff_doc.add_paragraph()
-                set_alignment(ref_p, 'center')
-                set_spacing(ref_p, {'space_before': 12.0, 'space_after': 6.0, 'line_spacing': 1.0})
-                run = ref_p.add_run(ref)
-                run.bold = True
-                run.font.name = 'Arial'
-                run.font.size = Pt(12)
-                run.font.color.rgb = RGBColor(0, 204, 51)
-                self.diff_doc._body._element.insert(pos, ref_p._element)
-
-            # Add "." spacer after Član 1 body
-            diff_blocks = list(iter_block_items(self.diff_doc))  # Refresh list after insertions
-            for idx, block in enumerate(diff_blocks):
-                if isinstance(block, Paragraph) and block.text.strip() == "Član 1":
-                    spacer = self.diff_doc.add_paragraph(".")
-                    deep_copy_paragraph(block, spacer)
-                    self.diff_doc._body._element.insert(idx + 2, spacer._element)
-                    break
-
-            self.update_log("Part B complete.")
-            messagebox.showinfo("Success", "Colored diff generated.")
+            orig_path, new_path, amend_path = self.orig_path, self.new_path, self.amend_path
+
+            def _work():
+                orig = self._load(orig_path)
+                # _load caches by path, so the same file in both slots is one Document
+                new_d = self._load(new_path)
+                gov = self._load(amend_path)
+                diff_doc = _build_diff_doc(orig, new_d, extract_amending_ref(gov),
+                                           {'space_before': 12.0, 'space_after': 6.0, 'line_spacing': 1.0})
+
+                # Add "." spacer after Član 1 body
+                for el in diff_doc.element.body.iterchildren(_W_P):
+                    if paragraph_text(el).strip() == "Član 1":
+                        body_el = el.getnext()  # may be a reference inserted above, as before
+                        (body_el if body_el is not None else el).addnext(restyled_paragraph(el, "."))
+                        break
+
+                self.diff_doc = diff_doc
+                self.after(0, lambda: (self.update_log("Part B complete."), messagebox.showinfo("Success", "Colored diff generated.")))
+
+            self._submit("Part B", _work)
 
         def save(self, doc, kind):
             if not doc:
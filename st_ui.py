@@ -1,19 +1,15 @@
 import streamlit as st
-import os
-import tempfile
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from docx import Document
 from io import BytesIO
 from openai import OpenAI
 
-# Import all functions from f3.py
-from f3 import (
-    iter_block_items, extract_articles, merge_gazette, apply_amendment_text,
-    extract_amending_ref, add_explanatory_table, deep_copy_paragraph,
-    deep_copy_table, ARTICLE_RE, CHANGE_RE, hex_to_rgb, set_alignment,
-    RGBColor, Pt, SequenceMatcher
-)
+# Import the pipelines and helpers used here from f3.py
+from f3 import extract_amending_ref, build_new_docx, build_diff_docx
 
 # Initialize OpenAI client with secrets
 try:
@@ -30,218 +26,32 @@ def add_log_message(message):
     timestamp = datetime.now().strftime('%H:%M:%S')
     st.session_state.log_messages.append(f"{timestamp} - {message}")
 
-def process_part_a(orig_file, amend_file):
-    """Process Part A: Generate New.docx"""
-    if not client:
-        add_log_message("Error: OpenAI API key not configured")
-        return None
-        
-    add_log_message("Processing Part A...")
-    
-    try:
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_orig:
-            tmp_orig.write(orig_file.read())
-            orig_path = tmp_orig.name
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_amend:
-            tmp_amend.write(amend_file.read())
-            amend_path = tmp_amend.name
-        
-        # Load documents
-        orig = Document(orig_path)
-        updated_doc = Document()
-        
-        # Copy original document structure
-        for block in iter_block_items(orig):
-            if hasattr(block, 'text'):  # Paragraph
-                p = updated_doc.add_paragraph()
-                deep_copy_paragraph(block, p)
-            else:  # Table
-                deep_copy_table(block, updated_doc)
-        
-        # Merge gazette information
-        merge_gazette(orig, Document(amend_path), updated_doc)
-        
-        # Extract articles and apply amendments
-        articles = extract_articles(updated_doc)
-        amend_doc = Document(amend_path)
-        amendments = [p.text.strip() for p in amend_doc.paragraphs if "prestaju da važe" in p.text]
-        
-        for inst in amendments:
-            matches = CHANGE_RE.findall(inst)
-            for article_num, stav_num in matches:
-                aid = f"Član {article_num}"
-                if aid in articles:
-                    s, e = articles[aid]
-                    old_lines = '\n'.join(updated_doc.paragraphs[k].text for k in range(s, e))
-                    new_lines = apply_amendment_text(old_lines, inst)
-                    
-                    # Remove old paragraphs
-                    for k in range(e - 1, s - 1, -1):
-                        updated_doc.paragraphs[k]._element.getparent().remove(updated_doc.paragraphs[k]._element)
-                    
-                    # Insert new paragraphs
-                    for i, line in enumerate(new_lines):
-                        new_p = updated_doc.add_paragraph(line)
-                        original_format_idx = s + i
-                        if original_format_idx < len(orig.paragraphs):
-                            deep_copy_paragraph(orig.paragraphs[original_format_idx], new_p)
-                        
-                        # Format article titles
-                        if ARTICLE_RE.match(line):
-                            set_alignment(new_p, 'center')
-                            for run in new_p.runs:
-                                run.bold = True
-                                run.font.name = 'Arial'
-                                run.font.size = Pt(12)
-        
-        # Clean up temporary files
-        os.unlink(orig_path)
-        os.unlink(amend_path)
-        
-        add_log_message("Part A completed successfully")
-        return updated_doc
-        
-    except Exception as e:
-        add_log_message(f"Error in Part A: {str(e)}")
-        return None
+@st.cache_resource
+def get_process_pool():
+    """Worker processes shared by every session; Part A and Part B run here off the script thread."""
+    # spawn: fork is missing on Windows and can deadlock under Streamlit's threads; the jobs live in f3, so they import cleanly
+    return ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
 
-def process_part_b(orig_file, new_file, amend_file):
-    """Process Part B: Generate Colored Diff.docx"""
-    add_log_message("Processing Part B...")
-    
+def run_in_pool(label, func, *args):
+    """Run func(*args) in the process pool and log the outcome; returns its result or None"""
+    add_log_message(f"Processing {label}...")
     try:
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_orig:
-            tmp_orig.write(orig_file.read())
-            orig_path = tmp_orig.name
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_new:
-            tmp_new.write(new_file.read())
-            new_path = tmp_new.name
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_amend:
-            tmp_amend.write(amend_file.read())
-            amend_path = tmp_amend.name
-        
-        # Load documents
-        orig = Document(orig_path)
-        new_d = Document(new_path)
-        gov = Document(amend_path)
-        diff_doc = Document()
-        
-        # Add explanatory table
-        add_explanatory_table(diff_doc)
-        
-        # Prepare texts for diff
-        orig_blocks = list(iter_block_items(orig))
-        new_blocks = list(iter_block_items(new_d))
-        
-        orig_texts = []
-        for b in orig_blocks:
-            if hasattr(b, 'text'):
-                orig_texts.append(b.text.strip())
-            else:
-                orig_texts.append('TABLE')
-        
-        new_texts = []
-        for b in new_blocks:
-            if hasattr(b, 'text'):
-                text = b.text.strip().replace('*', '')
-                new_texts.append(text)
-            else:
-                new_texts.append('TABLE')
-        
-        # Generate diff
-        matcher = SequenceMatcher(None, orig_texts, new_texts)
-        
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            if tag == 'equal':
-                for k in range(i1, i2):
-                    block = new_blocks[j1 + (k - i1)]
-                    if hasattr(block, 'text'):
-                        p = diff_doc.add_paragraph()
-                        deep_copy_paragraph(block, p)
-                    else:
-                        deep_copy_table(block, diff_doc)
-            elif tag == 'delete':
-                for k in range(i1, i2):
-                    block = orig_blocks[k]
-                    if hasattr(block, 'text'):
-                        p = diff_doc.add_paragraph('[' + block.text + ']')
-                        deep_copy_paragraph(block, p)
-                        for run in p.runs:
-                            run.font.color.rgb = RGBColor(255, 0, 0)
-                    else:
-                        deep_copy_table(block, diff_doc, color=RGBColor(255, 0, 0))
-            elif tag == 'insert':
-                for k in range(j1, j2):
-                    block = new_blocks[k]
-                    if hasattr(block, 'text'):
-                        p = diff_doc.add_paragraph('[' + block.text + ']')
-                        deep_copy_paragraph(block, p)
-                        for run in p.runs:
-                            run.font.color.rgb = RGBColor(0, 204, 51)
-                    else:
-                        deep_copy_table(block, diff_doc, color=RGBColor(0, 204, 51))
-            elif tag == 'replace':
-                for k in range(i1, i2):
-                    block = orig_blocks[k]
-                    if hasattr(block, 'text'):
-                        p = diff_doc.add_paragraph('[' + block.text + ']')
-                        deep_copy_paragraph(block, p)
-                        for run in p.runs:
-                            run.font.color.rgb = RGBColor(255, 0, 0)
-                    else:
-                        deep_copy_table(block, diff_doc, color=RGBColor(255, 0, 0))
-                for k in range(j1, j2):
-                    block = new_blocks[k]
-                    if hasattr(block, 'text'):
-                        p = diff_doc.add_paragraph('[' + block.text + ']')
-                        deep_copy_paragraph(block, p)
-                        for run in p.runs:
-                            run.font.color.rgb = RGBColor(0, 204, 51)
-                    else:
-                        deep_copy_table(block, diff_doc, color=RGBColor(0, 204, 51))
-        
-        # Insert dynamic green reference
-        diff_blocks = list(iter_block_items(diff_doc))
-        insert_positions = []
-        ref = extract_amending_ref(gov)
-        
-        for idx, block in enumerate(diff_blocks):
-            if hasattr(block, 'text') and ARTICLE_RE.match(block.text.strip()) and '*' in block.text:
-                insert_positions.append(idx)
-        
-        for pos in reversed(insert_positions):
-            ref_p = diff_doc.add_paragraph()
-            set_alignment(ref_p, 'center')
-            run = ref_p.add_run(ref)
-            run.bold = True
-            run.font.name = 'Arial'
-            run.font.size = Pt(12)
-            run.font.color.rgb = RGBColor(0, 204, 51)
-            diff_doc._body._element.insert(pos, ref_p._element)
-        
-        # Clean up temporary files
-        os.unlink(orig_path)
-        os.unlink(new_path)
-        os.unlink(amend_path)
-        
-        add_log_message("Part B completed successfully")
-        return diff_doc
-        
+        result = get_process_pool().submit(func, *args).result()
+    except BrokenProcessPool as e:
+        # A dead worker breaks the pool for good; drop it so the next run starts a fresh one
+        get_process_pool.clear()
+        add_log_message(f"Error in {label}: {str(e)}")
+        return None
     except Exception as e:
-        add_log_message(f"Error in Part B: {str(e)}")
+        add_log_message(f"Error in {label}: {str(e)}")
         return None
+    add_log_message(f"{label} completed successfully")
+    return result
 
-def doc_to_bytes(doc):
-    """Convert Document to bytes for download"""
-    bio = BytesIO()
-    doc.save(bio)
-    bio.seek(0)
-    return bio.getvalue()
+@st.cache_data(show_spinner=False, max_entries=8)
+def amending_ref_of(data):
+    """Green reference line for a gov changes .docx, memoized on its bytes across reruns"""
+    return extract_amending_ref(Document(BytesIO(data)))
 
 def main():
     st.set_page_config(
@@ -293,6 +103,9 @@ def main():
     # Processing section
     st.header("🔄 Processing")
     
+    st.checkbox("⚡ Fast download (quicker to build, larger .docx)", key='fast_download')
+    fast = st.session_state.get('fast_download', False)
+    
     col1, col2 = st.columns(2)
     
     with col1:
@@ -301,8 +114,17 @@ def main():
             disabled=not (orig_file and amend_file),
             use_container_width=True
         ):
-            with st.spinner("Processing Part A..."):
-                st.session_state.updated_doc = process_part_a(orig_file, amend_file)
+            if not client:
+                add_log_message("Error: OpenAI API key not configured")
+                st.session_state.updated_doc = None
+            else:
+                with st.spinner("Processing Part A..."):
+                    result = run_in_pool(
+                        "Part A", build_new_docx, orig_file.getvalue(), amend_file.getvalue(), fast
+                    )
+                st.session_state.updated_doc, unapplied = result or (None, [])
+                if unapplied:
+                    add_log_message(f"Not applied, original text kept: {', '.join(unapplied)}")
             
             if st.session_state.updated_doc:
                 st.success("✅ New.docx generated successfully!")
@@ -316,7 +138,10 @@ def main():
             use_container_width=True
         ):
             with st.spinner("Processing Part B..."):
-                st.session_state.diff_doc = process_part_b(orig_file, new_file, amend_file)
+                st.session_state.diff_doc = run_in_pool(
+                    "Part B", build_diff_docx, orig_file.getvalue(), new_file.getvalue(),
+                    amending_ref_of(amend_file.getvalue()), fast
+                )
             
             if st.session_state.diff_doc:
                 st.success("✅ Colored diff.docx generated successfully!")
@@ -332,10 +157,9 @@ def main():
     
     with col1:
         if st.session_state.updated_doc:
-            doc_bytes = doc_to_bytes(st.session_state.updated_doc)
             st.download_button(
                 label="📥 Download New.docx",
-                data=doc_bytes,
+                data=st.session_state.updated_doc,
                 file_name=f"new_law_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                 use_container_width=True
@@ -345,10 +169,9 @@ def main():
     
     with col2:
         if st.session_state.diff_doc:
-            doc_bytes = doc_to_bytes(st.session_state.diff_doc)
             st.download_button(
                 label="📥 Download Colored Diff.docx",
-                data=doc_bytes,
+                data=st.session_state.diff_doc,
                 file_name=f"colored_diff_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                 use_container_width=True
@@ -0,0 +1,21 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def f3(tmp_path_factory):
+    # f3 makes docs/samples and a processor log in the working directory on import; keep them out of the tree
+    work = tmp_path_factory.mktemp("f3")
+    (work / ".streamlit").mkdir()
+    (work / ".streamlit" / "secrets.toml").write_text('OPENAI_API_KEY = "test"\n')
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        return importlib.import_module("f3")
+    finally:
+        os.chdir(cwd)
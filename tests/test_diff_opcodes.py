@@ -0,0 +1,63 @@
+import random
+
+
+def lcs_length(a, b):
+    row = [0] * (len(b) + 1)
+    for x in a:
+        prev = 0
+        for j, y in enumerate(b):
+            cur = row[j + 1]
+            row[j + 1] = prev + 1 if x == y else max(row[j + 1], row[j])
+            prev = cur
+    return row[-1]
+
+
+def check_opcodes(a, b, opcodes):
+    i = j = 0
+    equal = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+            equal += i2 - i1
+        elif tag == 'delete':
+            assert i1 < i2 and j1 == j2
+        elif tag == 'insert':
+            assert i1 == i2 and j1 < j2
+        else:
+            assert tag == 'replace' and i1 < i2 and j1 < j2
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return equal
+
+
+def test_diff_opcodes_matches_lcs(f3):
+    rng = random.Random(0)
+    for _ in range(500):
+        a = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        b = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        assert check_opcodes(a, b, f3.diff_opcodes(a, b)) == lcs_length(a, b)
+
+
+def test_diff_opcodes_fallback_covers_both(f3, monkeypatch):
+    monkeypatch.setattr(f3._myers_equal_runs, "__defaults__", (0, 2))
+    rng = random.Random(1)
+    for _ in range(200):
+        a = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        b = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        check_opcodes(a, b, f3.diff_opcodes(a, b))
+
+
+def test_diff_opcodes_disjoint_falls_back(f3, monkeypatch):
+    returned = []
+    myers = f3._myers_equal_runs
+
+    def recording(*args, **kwargs):
+        returned.append(myers(*args, **kwargs))
+        return returned[-1]
+
+    monkeypatch.setattr(f3, "_myers_equal_runs", recording)
+    a = list(range(3000))
+    b = list(range(3000, 6000))
+    assert f3.diff_opcodes(a, b) == [('replace', 0, 3000, 0, 3000)]
+    assert returned == [None]
@@ -0,0 +1,29 @@
+import pytest
+
+OLD = "Član 5\nPrvi stav.\nDrugi stav.\nTreći stav."
+
+
+def repeal(*refs):
+    clauses = " i ".join(f"člana {article}. stav {stav}. Zakona o računovodstvu" for article, stav in refs)
+    return f"Danom početka primene ovog zakona odredbe {clauses} prestaju da važe."
+
+
+@pytest.mark.parametrize("old_text, instruction, expected", [
+    # single stav repeal
+    (OLD, repeal((5, 2)), ["Član 5*", "Prvi stav.", "Treći stav."]),
+    # several stavs of one article
+    (OLD, repeal((5, 1), (5, 3)), ["Član 5*", "Drugi stav."]),
+    # stav number out of range
+    (OLD, repeal((5, 4)), None),
+    # another article is named too: only this article's stavs are dropped
+    (OLD, repeal((9, 1), (5, 2)), ["Član 5*", "Prvi stav.", "Treći stav."]),
+    # only another article is named
+    (OLD, repeal((9, 1)), None),
+    # other kinds of change go to GPT
+    (OLD, repeal((5, 2)) + " Stav 3. menja se i glasi: ...", None),
+    (OLD, repeal((5, 2)) + " Posle stava 3. dodaje se novi stav 4.", None),
+    # a title that already carries the star keeps just one
+    ("Član 5*\nPrvi stav.\nDrugi stav.", repeal((5, 2)), ["Član 5*", "Prvi stav."]),
+])
+def test_local_apply_amendment(f3, old_text, instruction, expected):
+    assert f3.local_apply_amendment(old_text, instruction) == expected